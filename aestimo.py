@@ -25,9 +25,9 @@
 import time
 time0 = time.time() # timing audit
 #from scipy.optimize import fsolve
-import matplotlib.pyplot as pl
+from scipy.optimize import brentq
 import numpy as np
-alen = np.alen
+
 import os
 import config,database
 from math import log,exp
@@ -63,6 +63,15 @@ meV2J=1e-3*q #meV to Joules
 time1 = time.time() # timing audit
 #logger.info("Aestimo is starting...")
 
+#matplotlib is only needed by the result viewer and importing it is a large
+#part of aestimo's startup time, so it is deferred until a plot is requested
+#(keeps batch/headless runs lean).
+pl = None
+def _import_pyplot():
+    global pl
+    if pl is None:
+        import matplotlib.pyplot as pl
+
 # Input Class
 # -------------------------------------
 
@@ -208,7 +217,7 @@ class StructureFrom(Structure):
         
         # Loading material list
         self.material = inputfile.material
-        totallayer = alen(self.material)
+        totallayer = len(self.material)
         logger.info("Total layer number: %s",totallayer)
         
         # Calculate the required number of grid points
@@ -223,10 +232,10 @@ class StructureFrom(Structure):
                 
         # Loading materials database
         self.material_property = database.materialproperty
-        totalmaterial = alen(self.material_property)
+        totalmaterial = len(self.material_property)
         
         self.alloy_property = database.alloyproperty
-        totalalloy = alen(self.alloy_property)
+        totalalloy = len(self.alloy_property)
         
         logger.info("Total number of materials in database: %d",(totalmaterial+totalalloy))
         
@@ -271,14 +280,14 @@ class StructureFrom(Structure):
         eps =np.zeros(n_max)        #dielectric constant
         dop = np.zeros(n_max)           #doping
         
-        position = 0.0 # keeping in nanometres (to minimise errors)
-        for layer in self.material:
-            startindex = round2int(position*1e-9/dx)
-            position += layer[0] # update position to end of the layer
-            finishindex = round2int(position*1e-9/dx)
+        # layer boundaries: cumulative thicknesses (nm, to minimise errors) mapped
+        # to grid indices in one vectorized pass (same rounding as round2int)
+        position = np.hstack(([0.0],np.cumsum([layer[0] for layer in self.material])))
+        layer_bounds = np.floor(position*1e-9/dx + 0.5).astype(int)
+        for layer,startindex,finishindex in zip(self.material,layer_bounds[:-1],layer_bounds[1:]):
             #
             matType = layer[1]
-            
+
             if matType in material_property:
                 matprops = material_property[matType]
                 fi[startindex:finishindex] = matprops['Band_offset']*matprops['Eg']*q #Joule
@@ -398,6 +407,13 @@ def psi_at_inf2(E,fis,model,n_max,dx):
     cb_meff = model.cb_meff_E(E,fis) # energy dependent mass
     return psi_at_inf(E,fis,cb_meff,n_max,dx)
 
+def inverse_mass_terms(cb_meff):
+    """harmonic-mean effective mass terms 2/(cb_meff[j]+cb_meff[j+1]) used by
+    the shooting recurrence (len n_max-1). These depend only on the mass
+    profile, so for parabolic dispersions they can be computed once per
+    energy search instead of inside the recurrence's loop."""
+    return 2.0/(cb_meff[1:]+cb_meff[:-1])
+
 try:
     from psi_at_inf_cython import psi_at_inf_numpy
     
@@ -412,6 +428,266 @@ try:
 except ImportError:
     logger.warning("psi_at_inf_cython module not found")
 
+try:
+    import numba
+
+    @numba.njit(cache=True, fastmath=True)
+    def psi_at_inf_numba(c0E,K,inv_m,n_max):
+        """Shooting method for heterostructure as given in Harrison's book.
+        numba compiled version of original psi_at_inf function. The
+        loop-invariant factors are precomputed by the callers: K holds
+        c0*fis with c0 = 2*(dx/hbar)**2, c0E holds c0*E, and inv_m holds the
+        harmonic-mean mass terms 2/(cb_meff[j]+cb_meff[j+1]) (len n_max-1,
+        see inverse_mass_terms). The inner loop is then a single subtraction
+        and multiply-add chain per grid point."""
+        # boundary conditions
+        psi0 = 0.0
+        psi1 = 1.0
+        psi2 = 0.0
+        for j in range(1,n_max-1,1):
+            # Last potential not used
+            c1=inv_m[j-1]
+            c2=inv_m[j]
+            psi2=((K[j]-c0E+c2+c1)*psi1-c1*psi0)/c2
+            psi0=psi1
+            psi1=psi2
+        return psi2
+
+    def psi_at_inf1_numba(E,fis,model,n_max,dx):
+        c0 = 2*(dx/hbar)**2
+        return psi_at_inf_numba(c0*E,model._K,model._inv_m,n_max)
+
+    def psi_at_inf2_numba(E,fis,model,n_max,dx):
+        """shooting method with non-parabolicity"""
+        cb_meff_E = model.cb_meff_E(E,fis) # energy dependent mass
+        c0 = 2*(dx/hbar)**2
+        return psi_at_inf_numba(c0*E,c0*fis,inverse_mass_terms(cb_meff_E),n_max)
+
+    @numba.njit(cache=True)
+    def psi_at_inf_f32_numba(c0E,K,inv_m,n_max):
+        """float32 shooting recurrence, used for the coarse bracket scan when
+        config.use_fp32_shooting is set. Halves the memory traffic of the
+        array loads along the grid. The c0*fis product is prefolded into K
+        (float32, see calc_E_state) because c0 = 2*(dx/hbar)**2 itself
+        overflows the float32 range; likewise c0E = c0*E is folded by the
+        caller. Only the sign and rough magnitude of the returned value are
+        used during the scan, so the reduced precision is acceptable; the
+        caller falls back to the float64 kernel whenever the recurrence
+        overflows. nb. no fastmath here or in _scan_shoot_numba - fastmath
+        assumes no infs/nans, which both lets the compiler mangle the
+        overflowing recurrence and folds away the isfinite guard that the
+        float64 fallback depends on."""
+        psi0 = np.float32(0.0)
+        psi1 = np.float32(1.0)
+        psi2 = np.float32(0.0)
+        for j in range(1,n_max-1,1):
+            # Last potential not used
+            c1=inv_m[j-1]
+            c2=inv_m[j]
+            psi2=((K[j]-c0E+c2+c1)*psi1-c1*psi0)/c2
+            psi0=psi1
+            psi1=psi2
+        return np.float64(psi2)
+
+    @numba.njit(cache=True, fastmath=True)
+    def psi_at_inf_dE_numba(c0E,K,inv_m,n_max,c0):
+        """Shooting method returning both psi(+infinity) and its derivative
+        with respect to E, found by propagating the E-derivative of the
+        recurrence alongside psi in a single sweep. Only valid when cb_meff
+        does not depend on E (parabolic dispersions). Allows each
+        Newton-Raphson step of the energy search to use one shoot instead of
+        three (and an exact derivative instead of a finite difference).
+        K, c0E and inv_m are the precomputed loop invariants described in
+        psi_at_inf_numba; c0 itself is still needed for the derivative."""
+        # boundary conditions
+        psi0 = 0.0
+        psi1 = 1.0
+        psi2 = 0.0
+        dpsi0 = 0.0
+        dpsi1 = 0.0
+        dpsi2 = 0.0
+        for j in range(1,n_max-1,1):
+            # Last potential not used
+            c1=inv_m[j-1]
+            c2=inv_m[j]
+            c3=K[j]-c0E+c2+c1
+            psi2=(c3*psi1-c1*psi0)/c2
+            dpsi2=(c3*dpsi1-c0*psi1-c1*dpsi0)/c2
+            psi0=psi1
+            psi1=psi2
+            dpsi0=dpsi1
+            dpsi1=dpsi2
+        return psi2,dpsi2
+
+    @numba.njit(cache=True)
+    def _brent_refine_numba(xpre,xcur,fpre,fcur,K,inv_m,n_max,c0,xtol):
+        """Brent's method root refinement of the shooting function within the
+        bracket [xpre,xcur] (fpre*fcur < 0), following the bisection/secant/
+        inverse-quadratic scheme of scipy.optimize.brentq so that the
+        compiled driver honours config.use_brentq like the interpreted
+        search. Energies are in Joules; xtol matches brentq's meaning."""
+        rtol = 4.0*2.220446049250313e-16 #scipy's default relative tolerance
+        xblk = 0.0; fblk = 0.0; spre = 0.0; scur = 0.0
+        for i in range(100):
+            if fpre*fcur < 0.0:
+                xblk = xpre; fblk = fpre
+                spre = xcur - xpre; scur = xcur - xpre
+            if abs(fblk) < abs(fcur):
+                xpre = xcur; xcur = xblk; xblk = xpre
+                fpre = fcur; fcur = fblk; fblk = fpre
+            delta = (xtol + rtol*abs(xcur))/2.0
+            sbis = (xblk - xcur)/2.0
+            if fcur == 0.0 or abs(sbis) < delta:
+                return xcur
+            if abs(spre) > delta and abs(fcur) < abs(fpre):
+                if xpre == xblk: #secant step
+                    stry = -fcur*(xcur - xpre)/(fcur - fpre)
+                else: #inverse quadratic interpolation
+                    dpre = (fpre - fcur)/(xpre - xcur)
+                    dblk = (fblk - fcur)/(xblk - xcur)
+                    stry = -fcur*(fblk*dblk - fpre*dpre)/(dblk*dpre*(fblk - fpre))
+                if 2.0*abs(stry) < min(abs(spre),3.0*abs(sbis) - delta):
+                    spre = scur; scur = stry #accept the interpolation
+                else:
+                    spre = sbis; scur = sbis #fall back to bisection
+            else:
+                spre = sbis; scur = sbis
+            xpre = xcur; fpre = fcur
+            if abs(scur) > delta:
+                xcur += scur
+            else:
+                xcur += delta if sbis > 0.0 else -delta
+            fcur = psi_at_inf_numba(c0*xcur,K,inv_m,n_max)
+        return xcur
+
+    @numba.njit(cache=True)
+    def _scan_shoot_numba(c0E,K,inv_m,n_max,K_f32,inv_m_f32,use_f32):
+        """One shoot of the bracket scan, in float32 when enabled with a
+        float64 retry if the reduced range overflowed. Compiled without
+        fastmath so the isfinite overflow check survives compilation (see
+        psi_at_inf_f32_numba)."""
+        if use_f32:
+            y = psi_at_inf_f32_numba(np.float32(c0E),K_f32,inv_m_f32,n_max)
+            if np.isfinite(y):
+                return y
+        return psi_at_inf_numba(c0E,K,inv_m,n_max)
+
+    #nb. no fastmath on the driver: numba propagates a caller's fastmath into
+    #the callees it compiles, which would strip the isfinite overflow guard
+    #out of _scan_shoot_numba (see psi_at_inf_f32_numba). The arithmetic-heavy
+    #work is all inside the shooting kernels anyway.
+    @numba.njit(cache=True)
+    def calc_E_states_numba(numlevels,K,inv_m,n_max,dx,energyx0,delta_E,convergence_test,K_f32,inv_m_f32,use_f32,use_brentq):
+        """Runs the whole bound-state energy search (bracket scan plus root
+        refinement) inside one compiled loop, removing the python dispatch
+        between shoots. Refinement is Brent's method when use_brentq is set
+        (mirroring config.use_brentq on the interpreted path), otherwise
+        Newton-Raphson with the analytic E-derivative. The search is
+        sequential over the levels by construction - each level's scan
+        starts from the previous level's energy - so it cannot be parallelised
+        over the subbands. Returns the energies in Joules."""
+        E_states = np.zeros(numlevels)
+        energyx = energyx0
+        c0 = 2*(dx/hbar)**2
+        for i in range(numlevels):
+            #increment energy-search for f(x)=0
+            y2 = _scan_shoot_numba(c0*energyx,K,inv_m,n_max,K_f32,inv_m_f32,use_f32)
+            while True:
+                y1=y2
+                energyx += delta_E
+                y2 = _scan_shoot_numba(c0*energyx,K,inv_m,n_max,K_f32,inv_m_f32,use_f32)
+                if y1*y2 < 0:
+                    break
+            if use_brentq:
+                #refine the root within the bracket
+                ya = y1; yb = y2
+                if use_f32: #the scan may have shot the ends in float32; the
+                            #refinement stays in double precision
+                    ya = psi_at_inf_numba(c0*(energyx-delta_E),K,inv_m,n_max)
+                    yb = psi_at_inf_numba(c0*energyx,K,inv_m,n_max)
+                energyx = _brent_refine_numba(energyx-delta_E,energyx,ya,yb,K,inv_m,n_max,c0,convergence_test)
+            else:
+                # improve estimate using midpoint rule
+                energyx -= abs(y2)/(abs(y1)+abs(y2))*delta_E
+                #implement Newton-Raphson method
+                while True:
+                    y,dy = psi_at_inf_dE_numba(c0*energyx,K,inv_m,n_max,c0)
+                    energyx -= y/dy
+                    if abs(y/dy) < convergence_test:
+                        break
+            E_states[i] = energyx
+            # clears x from solution
+            energyx += delta_E # finish for i-th state.
+        return E_states
+
+    @numba.njit(cache=True, fastmath=True)
+    def wf_numba(c0E,K,inv_m,b,n_max):
+        """Computes the unnormalised wavefunction for energy E (see wf). The
+        wavefunction is written into the preallocated array b (len n_max) and
+        the normalisation integral (sum of psi**2) is returned. K, c0E and
+        inv_m are the precomputed loop invariants described in
+        psi_at_inf_numba."""
+        # boundary conditions
+        p0 = 0.0
+        p1 = 1.0
+        b[0] = p0
+        b[1] = p1
+        N = p0*p0 + p1*p1 # Normalization integral
+        for j in range(1,n_max-1,1):
+            # Last potential not used
+            c1=inv_m[j-1]
+            c2=inv_m[j]
+            p2=((K[j]-c0E+c2+c1)*p1-c1*p0)/c2
+            b[j+1]=p2
+            N += p2*p2
+            p0=p1
+            p1=p2
+        return N
+
+    @numba.njit(cache=True, fastmath=True)
+    def update_potential_numba(wfe,N_state,dop,eps,dx):
+        """Fused version of the calc_sigma/calc_field/calc_potn chain used by
+        the self-consistent loop. The three functions each traverse the full
+        grid and hand a freshly allocated array to the next; here the field
+        and potential prefix sums are carried as running scalars in a single
+        second pass, so sigma is read straight out of registers/L1 instead of
+        making three round-trips through memory. Returns (sigma,F,V) with
+        identical definitions to the unfused functions."""
+        n_max = dop.shape[0]
+        numlevels = wfe.shape[0]
+        sigma = np.empty(n_max)
+        F = np.empty(n_max)
+        V = np.empty(n_max)
+        # first pass: charge density and its total (needed for the field's
+        # integration constant before the running sums can start)
+        sigma_tot = 0.0
+        for i in range(n_max):
+            s = dop[i]*dx # The charges due to the dopant ions
+            for j in range(numlevels): # the charges due to the subband electrons
+                s -= N_state[j]*wfe[j,i]*wfe[j,i]
+            sigma[i] = s
+            sigma_tot += s
+        # second pass: running integrals for the field and the potential
+        f_acc = -q*sigma_tot/2.0 # F0
+        v_acc = 0.0
+        for i in range(n_max):
+            if i > 0:
+                f_acc += q/2.0*(sigma[i-1]+sigma[i])
+            F[i] = f_acc/eps[i]
+            v_acc += F[i]
+            V[i] = v_acc*q*dx
+        return sigma,F,V
+
+except ImportError:
+    logger.warning("numba module not found")
+    # fall back to the interpreted versions
+    psi_at_inf1_numba = psi_at_inf1
+    psi_at_inf2_numba = psi_at_inf2
+    psi_at_inf_dE_numba = None
+    calc_E_states_numba = None
+    wf_numba = None
+    update_potential_numba = None
+
 
 #nb. function was much slower when fi is a numpy array than a python list.
 def calc_E_state(numlevels,fi,model,energyx0): # delta_E,d_E
@@ -428,14 +704,28 @@ def calc_E_state(numlevels,fi,model,energyx0): # delta_E,d_E
     d_E = config.d_E #1e-5*meV2J #Energy step (Joules) for Newton-Raphson method when improving the precision of the energy of a found level.
     Estate_convergence_test = config.Estate_convergence_test #1e-9*meV2J
     #
-    E_state=[0.0]*numlevels #Energies of subbands (meV)
+    E_state=np.zeros(numlevels) #Energies of subbands (meV)
     cb_meff = model.cb_meff # effective mass of electrons in conduction band (kg)
     energyx = float(energyx0) #starting energy for subband search (Joules) + floats are faster than numpy.float64
     n_max = model.n_max
     dx = model.dx
     
+    #analytic E-derivative is only correct when the mass is energy independent
+    use_dE_kernel = (config.use_numba == True and psi_at_inf_dE_numba is not None
+                     and model.comp_scheme not in (1,3,6))
+    if config.use_numba == True and model.comp_scheme not in (1,3,6):
+        #parabolic dispersions: mass terms don't depend on E, hoist them and
+        #the c0*fis product out of the energy search (psi_at_inf1_numba picks
+        #these attributes up)
+        model._inv_m = inverse_mass_terms(cb_meff)
+        model._K = 2*(dx/hbar)**2*fi
     #choose shooting function
-    if config.use_cython == True:
+    if config.use_numba == True:
+        if model.comp_scheme in (1,3,6): #then include non-parabolicity calculation
+            psi_at_inf = psi_at_inf2_numba
+        else:
+            psi_at_inf = psi_at_inf1_numba
+    elif config.use_cython == True:
         if model.comp_scheme in (1,3,6): #then include non-parabolicity calculation
             psi_at_inf = psi_at_inf2_cython
         else:
@@ -446,6 +736,16 @@ def calc_E_state(numlevels,fi,model,energyx0): # delta_E,d_E
         else:
             psi_at_inf = psi_at_inf1
     
+    if use_dE_kernel: #run the whole search inside one compiled driver
+        use_f32 = config.use_fp32_shooting == True
+        if use_f32:
+            inv_m_f32 = model._inv_m.astype(np.float32)
+            K_f32 = model._K.astype(np.float32)
+        else:
+            K_f32 = inv_m_f32 = np.empty(0,dtype=np.float32)
+        E_state = calc_E_states_numba(numlevels,model._K,model._inv_m,n_max,dx,energyx,delta_E,Estate_convergence_test,K_f32,inv_m_f32,use_f32,config.use_brentq == True)
+        return E_state*J2meV
+
     #print 'energyx', energyx,type(energyx)
     #print 'cb_meff', cb_meff[0:10], type(cb_meff), type(cb_meff[0])
     #print 'n_max', n_max, type(n_max)
@@ -462,28 +762,61 @@ def calc_E_state(numlevels,fi,model,energyx0): # delta_E,d_E
             y2=psi_at_inf(energyx,fi,model,n_max,dx)
             if y1*y2 < 0:
                 break
-        # improve estimate using midpoint rule
-        energyx -= abs(y2)/(abs(y1)+abs(y2))*delta_E
-        #implement Newton-Raphson method
-        while True:
-            y = psi_at_inf(energyx,fi,model,n_max,dx)
-            dy = (psi_at_inf(energyx+d_E,fi,model,n_max,dx)- psi_at_inf(energyx-d_E,fi,model,n_max,dx))/(2.0*d_E)
-            energyx -= y/dy
-            if abs(y/dy) < Estate_convergence_test:
-                break
+        if config.use_brentq == True:
+            # refine the root within the bracket using Brent's method. This is
+            # both robust (the root cannot escape the bracket) and needs fewer
+            # shoots than Newton-Raphson with finite-difference derivatives.
+            energyx = brentq(psi_at_inf,energyx-delta_E,energyx,
+                             args=(fi,model,n_max,dx),xtol=Estate_convergence_test)
+        else:
+            # improve estimate using midpoint rule
+            energyx -= abs(y2)/(abs(y1)+abs(y2))*delta_E
+            #implement Newton-Raphson method
+            while True:
+                if use_dE_kernel: #one shoot gives both y and dy
+                    c0 = 2*(dx/hbar)**2
+                    y,dy = psi_at_inf_dE_numba(c0*energyx,model._K,model._inv_m,n_max,c0)
+                else:
+                    y = psi_at_inf(energyx,fi,model,n_max,dx)
+                    dy = (psi_at_inf(energyx+d_E,fi,model,n_max,dx)- psi_at_inf(energyx-d_E,fi,model,n_max,dx))/(2.0*d_E)
+                energyx -= y/dy
+                if abs(y/dy) < Estate_convergence_test:
+                    break
         E_state[i]=energyx*J2meV
         # clears x from solution
         energyx += delta_E # finish for i-th state.
     return E_state
 
 # FUNCTIONS for ENVELOPE FUNCTION WAVEFUNCTION--------------------------------
+def wf_python(E,fis,cb_meff_E,b,n_max,dx):
+    """Computes the unnormalised wavefunction for energy E (see wf). The
+    wavefunction is written into the preallocated array b (len n_max) and
+    the normalisation integral (sum of psi**2) is returned."""
+    cb_meff_E = cb_meff_E.tolist() #lists are faster than numpy arrays for loops
+    fis = fis.tolist() #lists are faster than numpy arrays for loops
+    c0 = 2*(dx/hbar)**2
+    # boundary conditions
+    p0 = 0.0
+    p1 = 1.0
+    b[0] = p0
+    b[1] = p1
+    N = p0*p0 + p1*p1 # Normalization integral
+    for j in range(1,n_max-1,1):
+        # Last potential not used
+        c1=2.0/(cb_meff_E[j]+cb_meff_E[j-1])
+        c2=2.0/(cb_meff_E[j]+cb_meff_E[j+1])
+        p2 = ((c0*(fis[j]-E)+c2+c1)*p1-c1*p0)/c2
+        b[j+1]=p2
+        N += p2*p2
+        p0=p1
+        p1=p2
+    return N
+
 def wf(E,fis,model):
     """This function returns the value of the wavefunction (psi)
     at +infinity for a given value of the energy.  The solution
     to the energy occurs for psi(+infinity)=0.
-    psi[3] wavefunction at z-delta_z, z and z+delta_z 
-    i index
-    
+
     E - eigen-energy of state (Joules)
     fis - Potential energy of system (Joules)
     model - an object with atributes:
@@ -492,56 +825,38 @@ def wf(E,fis,model):
         dx - step size (metres)"""
     #choosing effective mass function
     if model.comp_scheme in (1,3,6): #non-parabolicity calculation
-        cb_meff_E = model.cb_meff_E(E,fis).tolist()
+        cb_meff_E = model.cb_meff_E(E,fis)
     else:
-        cb_meff_E = model.cb_meff.tolist() #lists are faster than numpy arrays for loops
-    fis = fis.tolist() #lists are faster than numpy arrays for loops
+        cb_meff_E = model.cb_meff
     n_max = model.n_max
     dx = model.dx
-    #
-    N = 0.0 # Normalization integral
-    psi = []
-    psi = [0.0]*3
-    # boundary conditions
-    psi[0] = 0.0                 
-    psi[1] = 1.0
-    b = [0.0]*n_max
-    b[0] = psi[0]
-    b[1] = psi[1]
-    N += (psi[0])**2
-    N += (psi[1])**2
-    for j in range(1,n_max-1,1):
-        # Last potential not used
-        c1=2.0/(cb_meff_E[j]+cb_meff_E[j-1])
-        c2=2.0/(cb_meff_E[j]+cb_meff_E[j+1])
-        psi[2] = ((2*(dx/hbar)**2*(fis[j]-E)+c2+c1)*psi[1]-c1*psi[0])/c2
-        b[j+1]=psi[2]
-        N += (psi[2])**2
-        psi[0]=psi[1]
-        psi[1]=psi[2]
-    b2 = np.array(b)
-    b2/= N**0.5
-    return b2 # units of dx**0.5
+    b = np.empty(n_max) # wavefunction array
+    if config.use_numba == True and wf_numba is not None:
+        c0 = 2*(dx/hbar)**2
+        N = wf_numba(c0*E,c0*fis,inverse_mass_terms(cb_meff_E),b,n_max)
+    else:
+        N = wf_python(E,fis,cb_meff_E,b,n_max,dx)
+    b *= N**-0.5 #normalise with a single vectorized scale
+    return b # units of dx**0.5
 
     
 # FUNCTIONS for FERMI-DIRAC STATISTICS---SIMPLE---------------------------------   
 def fd2(Ei,Ef,T):
     """integral of Fermi Dirac Equation for energy independent density of states.
-    Ei [meV], Ef [meV], T [K]"""
-    return kb*T*log(exp(meV2J*(Ef-Ei)/(kb*T))+1)
+    Ei [meV], Ef [meV], T [K]. Ei can be an array, in which case all of the
+    subbands are evaluated in one vectorised call."""
+    return kb*T*np.log(np.exp(meV2J*(Ef-Ei)/(kb*T))+1)
 
 def calc_meff_state(wfe,cb_meff):
     """find subband effective masses"""
-    tmp = 1.0/np.sum(wfe**2/cb_meff,axis=1)
-    meff_state = tmp.tolist()
+    meff_state = 1.0/np.sum(wfe**2/cb_meff,axis=1)
     return meff_state #kg
 
 def calc_meff_state2(wfe,E_state,fi,model):
     """find subband effective masses including non-parabolicity
     (but stilling using a fixed effective mass for each subband dispersion)"""
     cb_meff_states = np.vstack([model.cb_meff_E(E*meV2J,fi) for E in E_state])
-    tmp = 1.0/np.sum(wfe**2/cb_meff_states,axis=1)
-    meff_state = tmp.tolist()
+    meff_state = 1.0/np.sum(wfe**2/cb_meff_states,axis=1)
     return meff_state #kg
     
 def fermilevel_0K(Ntotal2d,E_state,meff_state):
@@ -555,11 +870,9 @@ def fermilevel_0K(Ntotal2d,E_state,meff_state):
             break #we have found Ef and so we should break out of the loop
     else: #exception clause for 'for' loop.
         logger.warning("Have processed all energy levels present and so can't be sure that Ef is below next higher energy level.")
-    N_state=[0.0]*len(E_state)
-    for i,(Ei,csb_meff) in enumerate(zip(E_state,meff_state)):
-        Ni=(Ef - Ei)*csb_meff/(hbar**2*pi)*meV2J    # populations of levels
-        Ni*=(Ni>0.0)
-        N_state[i]=Ni
+    # populations of levels (zeroed where the level is above Ef)
+    N_state=(Ef - np.asarray(E_state))*np.asarray(meff_state)/(hbar**2*pi)*meV2J
+    N_state*=(N_state>0.0)
     return Ef,N_state #Fermi levels at 0K (meV), number of electrons in each subband at 0K
     
 def fermilevel(Ntotal2d,T,E_state,meff_state):
@@ -568,12 +881,11 @@ def fermilevel(Ntotal2d,T,E_state,meff_state):
     FD_d_E = config.FD_d_E #1e-9 Initial and minimum Energy step (meV) for derivative calculation for Newton-Raphson method to find E_F
     FD_convergence_test = config.FD_convergence_test #1e-6
     
+    E_state = np.asarray(E_state)
+    meff_state = np.asarray(meff_state)
     def func(Ef,E_state,meff_state,Ntotal2d,T):
-        #return Ntotal2d - sum( [csb_meff*fd2(Ei,Ef,T) for Ei,csb_meff in zip(E_state,meff_state)] )/(hbar**2*pi)
-        diff = Ntotal2d
-        for Ei,csb_meff in zip(E_state,meff_state):
-            diff -= csb_meff*fd2(Ei,Ef,T)/(hbar**2*pi)
-        return diff
+        #one vectorised call over the subbands replaces the python loop
+        return Ntotal2d - np.sum(meff_state*fd2(E_state,Ef,T))/(hbar**2*pi)
     Ef_0K,N_states_0K = fermilevel_0K(Ntotal2d,E_state,meff_state)
     #Ef=fsolve(func,Ef_0K,args=(E_state,meff_state,Ntotal2d,T))[0]
     #return float(Ef)
@@ -597,7 +909,7 @@ def fermilevel(Ntotal2d,T,E_state,meff_state):
 
 def calc_N_state(Ef,T,Ns,E_state,meff_state):
     # Find the subband populations, taking advantage of step like d.o.s. and analytic integral of FD
-    N_state=[fd2(Ei,Ef,T)*csb_meff/(hbar**2*pi) for Ei,csb_meff in zip(E_state,meff_state)]
+    N_state=fd2(np.asarray(E_state),Ef,T)*np.asarray(meff_state)/(hbar**2*pi)
     return N_state # number of carriers in each subband
     
 # FUNCTIONS for FERMI-DIRAC STATISTICS---NON-PARABOLIC--------------------------
@@ -631,8 +943,8 @@ def calc_N_state_np(Ef,T,level_dispersions):
     for Ea,cb_meff_a,ka in level_dispersions: #treat level separately
         Ea2 = Ea*meV2J
         tmp = cb_meff_a/(pi*hbar**2)/(np.exp((Ea2-meV2J*Ef)/(kb*T))+1.0)
-        N_state.append(np.trapz(tmp,x=Ea2))
-    return N_state
+        N_state.append(np.trapezoid(tmp,x=Ea2))
+    return np.array(N_state)
 
 def fermilevel_np(Ntotal2d,T,wfe,E_state,fi,model):
     """Finds the Fermi level (meV) for non-parabolic subbands"""
@@ -674,8 +986,8 @@ def calc_sigma(wfe,N_state,model):
     +ve ionised donors."""
     # note: model.dop is still a volume density, the delta_x converts it to an areal density
     sigma= model.dop*model.dx # The charges due to the dopant ions
-    for j in range(0,model.subnumber_e,1): # The charges due to the electrons in the subbands
-        sigma-= N_state[j]*(wfe[j])**2
+    # The charges due to the electrons in the subbands (one contraction over the subband index)
+    sigma-= np.einsum('j,ji->i',np.asarray(N_state),wfe*wfe)
     return sigma #charge per m**2 per dz (units of electronic charge)
     
 ##
@@ -688,12 +1000,14 @@ def calc_field(sigma,eps):
     # Note: 
     F0 = -np.sum(q*sigma)/(2.0) #CMP'deki i ve j yer değişebilir - de + olabilir
     # is the above necessary since the total field due to the structure should be zero.
-    # Do running integral
+    # Do running integral (prefix sums reduce the old nested loop over z and z'
+    # (see calc_field_old) to a single O(n_max) pass)
     tmp = np.hstack(([0.0],sigma[:-1])) + sigma
     tmp*= q/2.0 # Note: sigma is a number density per unit area, needs to be converted to Couloumb per unit area
-    tmp[0] = F0 
-    F = np.cumsum(tmp)/eps
-    return F #electric field
+    tmp[0] = F0
+    np.cumsum(tmp,out=tmp)
+    tmp/= eps
+    return tmp #electric field
 
 def calc_field_convolve(sigma,eps):
     tmp = np.ones(len(sigma)-1)
@@ -714,7 +1028,8 @@ def calc_field_old(sigma,eps):
     for i in range(0,n_max,1):
         for j in range(0,n_max,1):
            # Note sigma is a number density per unit area, needs to be converted to Couloumb per unit area
-           F[i] = F[i] + q*sigma[j]*cmp(i,j)/(2*eps[i]) #CMP'deki i ve j yer değişebilir - de + olabilir
+           # (1 if i>j else -1 if i<j else 0) is the py3 replacement for cmp(i,j)
+           F[i] = F[i] + q*sigma[j]*(1 if i>j else -1 if i<j else 0)/(2*eps[i]) #CMP'deki i ve j yer değişebilir - de + olabilir
     return F
 
 def calc_potn(F,dx):
@@ -723,10 +1038,26 @@ def calc_potn(F,dx):
     # i	index over z co-ordinates
 
     #Calculate the potential, defining the first point as zero
-    tmp = q*F*dx
-    V = np.cumsum(tmp) #+q -> electron -q->hole? 
+    V = np.cumsum(F) #+q -> electron -q->hole?
+    V*= q*dx #scalar factor applied once after the prefix sum
     return V
 
+def anderson_mix(V_hist,R_hist,damping):
+    """Anderson (Pulay) mixing of the Poisson potential. V_hist and R_hist
+    hold the last few input potentials and their residuals (Vnew - V). The
+    small least-squares problem finds the combination of previous iterations
+    that minimises the residual, which typically cuts the number of SCF
+    iterations several-fold compared with plain damping. Falls back to
+    plain damping while there is only one iteration of history."""
+    V = V_hist[-1]
+    R = R_hist[-1]
+    if len(V_hist) < 2:
+        return V + damping*R
+    dV = np.diff(np.array(V_hist),axis=0)
+    dR = np.diff(np.array(R_hist),axis=0)
+    gamma = np.linalg.lstsq(dR.T,R,rcond=None)[0]
+    return V - gamma.dot(dV) + damping*(R - gamma.dot(dR))
+
 
 # FUNCTIONS FOR EXCHANGE INTERACTION-------------------------------------------
 
@@ -799,8 +1130,8 @@ def Poisson_Schrodinger(model):
         logger.warning(scheme6warning)
     
     # Preparing empty subband energy lists.
-    E_state = [0.0]*subnumber_e     # Energies of subbands/levels (meV)
-    N_state = [0.0]*subnumber_e     # Number of carriers in subbands  
+    E_state = np.zeros(subnumber_e)     # Energies of subbands/levels (meV)
+    N_state = np.zeros(subnumber_e)     # Number of carriers in subbands
     
     # Creating and Filling material arrays
     xaxis = np.arange(0,n_max)*dx       #metres
@@ -814,7 +1145,7 @@ def Poisson_Schrodinger(model):
     wfe = np.zeros((subnumber_e,n_max))
     
     # Setup the doping
-    Ntotal = sum(dop) # calculating total doping density m-3
+    Ntotal = np.sum(dop) # calculating total doping density m-3
     Ntotal2d = Ntotal*dx
     if not(config.messagesoff):
         #print "Ntotal ",Ntotal,"m**-3"
@@ -827,7 +1158,8 @@ def Poisson_Schrodinger(model):
     # STARTING SELF CONSISTENT LOOP
     time2 = time.time() # timing audit
     iteration = 1   #iteration counter
-    previousE0= 0   #(meV) energy of zeroth state for previous iteration(for testing convergence)
+    prev_E = np.zeros(subnumber_e) #(meV) energies of previous iteration (for testing convergence)
+    V_hist,R_hist = [],[] #short history of potentials/residuals for Anderson mixing
     fitot = fi + Vapp #For initial iteration sum bandstructure and applied field
     
     fi_min= min(fitot) #minimum potential energy of structure (for limiting the energy range when searching for states)
@@ -882,16 +1214,20 @@ def Poisson_Schrodinger(model):
             N_state = calc_N_state(E_F,T,Ntotal2d,E_state,meff_state)
         # Calculate `net' areal charge density
         #print 'calc_sigma'
-        sigma=calc_sigma(wfe,N_state,model) #one more instead of subnumber_e
-        # Calculate electric field (Poisson/Hartree Effects)
-        if comp_scheme != 4: #in (0,1,2,3,5,6):
-            # Calculate electric field
-            F=calc_field(sigma,eps)
-            # Calculate potential due to charge distribution
-            Vnew=calc_potn(F,dx)
+        if comp_scheme != 4 and config.use_numba == True and update_potential_numba is not None:
+            # fused single sweep over the grid for sigma, field and potential
+            sigma,F,Vnew = update_potential_numba(wfe,np.asarray(N_state),dop,eps,dx)
         else:
-            F=np.zeros(n_max)
-            Vnew=0
+            sigma=calc_sigma(wfe,N_state,model) #one more instead of subnumber_e
+            # Calculate electric field (Poisson/Hartree Effects)
+            if comp_scheme != 4: #in (0,1,2,3,5,6):
+                # Calculate electric field
+                F=calc_field(sigma,eps)
+                # Calculate potential due to charge distribution
+                Vnew=calc_potn(F,dx)
+            else:
+                F=np.zeros(n_max)
+                Vnew=0
         # Exchange interaction    
         if comp_scheme in (4,5,6):
             # Exchange Potential
@@ -910,9 +1246,9 @@ def Poisson_Schrodinger(model):
             #for i,Ni in enumerate(N_state_0K):
             #    print 'N[',i,']= ',Ni
             logger.info('Efermi (at %gK) = %g meV',T, E_F)
-            logger.info("total donor charge = %g m**-2",sum(dop)*dx)
-            logger.info("total level charge = %g m**-2",sum(N_state))
-            logger.info("total system charge = %g m**-2",sum(sigma))
+            logger.info("total donor charge = %g m**-2",np.sum(dop)*dx)
+            logger.info("total level charge = %g m**-2",np.sum(N_state))
+            logger.info("total system charge = %g m**-2",np.sum(sigma))
         #
         if comp_scheme in (0,1): 
             #if we are not self-consistently including Poisson Effects then only do one loop
@@ -921,17 +1257,26 @@ def Poisson_Schrodinger(model):
         # Combine band edge potential with potential due to charge distribution
         # To increase convergence, we calculate a moving average of electric potential 
         #with previous iterations. By dampening the corrective term, we avoid oscillations.
-        V+= damping*(Vnew - V)
+        if config.use_anderson_mixing == True:
+            V_hist.append(V.copy())
+            R_hist.append(Vnew - V)
+            if len(V_hist) > config.anderson_depth: #ring buffer of recent iterations
+                V_hist.pop(0)
+                R_hist.pop(0)
+            V = anderson_mix(V_hist,R_hist,damping)
+        else:
+            V+= damping*(Vnew - V)
         fitot = fi + V + Vapp
-        
-        if abs(E_state[0]-previousE0) < convergence_test: #Convergence test
+
+        #Convergence test - all of the subbands must be stable, not just the ground state
+        if np.max(np.abs(E_state - prev_E)) < convergence_test:
             break
         elif iteration >= max_iterations: #Iteration limit
             logger.warning("Have reached maximum number of iterations")
             break
         else:
             iteration += 1
-            previousE0 = E_state[0]
+            prev_E = np.array(E_state)
     
     # END OF SELF-CONSISTENT LOOP
     time3 = time.time() # timing audit
@@ -968,14 +1313,14 @@ def save_and_plot(result,model):
         
     def saveoutput(fname,datatuple,header=None):
         fname2 = os.path.join(output_directory,fname)
-        fobj = file(fname2,'wb')
+        fobj = open(fname2,'w')
         if header: fobj.write(header+'\n')
         np.savetxt(fobj,np.column_stack(datatuple),fmt='%.6e', delimiter=' ')
         fobj.close()
         
     def saveoutput2(fname2,datatuple,header=None,fmt='%.6g',delimiter=', '):
         fname2 = os.path.join(output_directory,fname2)
-        fobj = file(fname2,'wb')
+        fobj = open(fname2,'w')
         if header: fobj.write(header+'\n')
         np.savetxt(fobj,np.column_stack(datatuple),fmt=fmt, delimiter=delimiter)
         fobj.close()
@@ -990,7 +1335,7 @@ def save_and_plot(result,model):
     if config.potential_out:
         saveoutput("potn.dat",(xaxis,result.fitot))
     if config.states_out:
-        rel_meff_state = [meff/m_e for meff in result.meff_state] #going to report relative effective mass.
+        rel_meff_state = np.asarray(result.meff_state)/m_e #going to report relative effective mass.
         columns = range(model.subnumber_e), result.E_state, result.N_state, rel_meff_state
         #header = " ".join([col.ljust(12) for col in ("State No.","Energy (meV)","N (m**-2)","Subband m* (m_e)")])
         header = "State No.    Energy (meV) N (m**-2)    Subband m* (kg)"
@@ -1001,6 +1346,7 @@ def save_and_plot(result,model):
     # Resultviewer
         
     if config.resultviewer:
+        _import_pyplot()
         pl.figure(figsize=(10,8))
         pl.suptitle('Aestimo Results')
         pl.subplots_adjust(hspace=0.4,wspace=0.4)
@@ -1063,7 +1409,7 @@ def save_and_plot(result,model):
         ax = pl.subplot(1,1,1)
         result.level_dispersions
         cb_meff0 = result.meff_state[0] #kg
-        ka = np.linspace(0.0,np.sqrt(2.0*cb_meff0*result.fitot.ptp())/hbar,50) #m**-1
+        ka = np.linspace(0.0,np.sqrt(2.0*cb_meff0*np.ptp(result.fitot))/hbar,50) #m**-1
         kax = ka*1e-9
         for Ei,meffi in zip(result.E_state,result.meff_state):
             p1, = pl.plot(kax,Ei+J2meV*hbar**2*ka**2/(2*cb_meff0),'k')
@@ -1083,6 +1429,7 @@ def save_and_plot(result,model):
 
 def QWplot(result,figno=None):
     """QW representation"""
+    _import_pyplot()
     xaxis = result.xaxis
     pl.figure(figno,figsize=(10,8))
     pl.suptitle('Aestimo Results')
@@ -1100,12 +1447,13 @@ def QWplot(result,figno=None):
         
 def dispersionplot(result,figno=None):
     """subband dispersion plot"""
+    _import_pyplot()
     pl.figure(figsize=(10,8))
     pl.suptitle('Subband Dispersions')
     ax = pl.subplot(1,1,1)
     result.level_dispersions
     cb_meff0 = result.meff_state[0] #kg
-    kmax = np.sqrt(2.0*cb_meff0*result.fitot.ptp()*meV2J)/hbar
+    kmax = np.sqrt(2.0*cb_meff0*np.ptp(result.fitot)*meV2J)/hbar
     ka = np.linspace(0.0,kmax,50) #m**-1
     kax = ka*1e-9
     for Ei,meffi in zip(result.E_state,result.meff_state):
@@ -1133,7 +1481,7 @@ def load_results():
             
     def loadoutput(fname,header=False,unpack=True):
         fname2 = os.path.join(output_directory,fname)
-        fobj = file(fname2,'rb')
+        fobj = open(fname2,'r')
         if header: header = fobj.readline()
         else: header = ''
         data = np.loadtxt(fobj,delimiter=' ',unpack=unpack)
@@ -1163,7 +1511,44 @@ def load_results():
     #results.V
     results.dx = np.mean(results.xaxis[1:]-results.xaxis[:-1])
     #results.level_dispersions = level_dispersions
-    
+
+    return results
+
+#names of the Results attributes stored in the binary results file. The arrays
+#keep full double precision (unlike the %.6e text files) and loading one .npz
+#is much faster than parsing the text output for large structures.
+_npz_array_attrs = ('xaxis','wfe','fitot','sigma','F','V',
+                    'E_state','N_state','meff_state')
+_npz_scalar_attrs = ('Fapp','T','E_F','dx','subnumber_e')
+
+def save_results_npz(result,output_directory=None):
+    """Saves the results to a single binary results.npz file in the output
+    folder (alongside the text output, which is still written by
+    save_and_plot). Returns the path of the file written.
+    nb. level_dispersions is not stored (it is a ragged list of arrays)."""
+    if output_directory is None: output_directory = config.output_directory
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    fname = os.path.join(output_directory,"results.npz")
+    data = {attr: np.asarray(getattr(result,attr))
+            for attr in _npz_array_attrs+_npz_scalar_attrs
+            if getattr(result,attr,None) is not None}
+    np.savez_compressed(fname,**data)
+    return fname
+
+def load_results_npz(output_directory=None):
+    """Loads the data stored by save_results_npz; a faster (and lossless)
+    alternative to parsing the text output with load_results"""
+    class Results(): pass
+    results = Results()
+
+    if output_directory is None: output_directory = config.output_directory
+    with np.load(os.path.join(output_directory,"results.npz")) as data:
+        for attr in _npz_array_attrs:
+            if attr in data: setattr(results,attr,data[attr])
+        for attr in _npz_scalar_attrs:
+            if attr in data: setattr(results,attr,data[attr].item())
+    results.level_dispersions = None #not stored in the file
     return results
 
 def run_aestimo(input_obj):
@@ -28,7 +28,7 @@ time0 = time.time() # timing audit
 #from scipy.optimize import fsolve
 import matplotlib.pyplot as pl
 import numpy as np
-alen = np.alen
+
 import os
 from math import log,exp,sqrt
 import VBHM
@@ -103,10 +103,10 @@ class Structure():
                 
         # Loading materials database
         self.material_property = database.materialproperty
-        totalmaterial = alen(self.material_property)
+        totalmaterial = len(self.material_property)
         
         self.alloy_property = database.alloyproperty
-        totalalloy = alen(self.alloy_property)
+        totalalloy = len(self.alloy_property)
         
         logger.info("Total material number in database: %d" ,(totalmaterial + totalalloy))
         
@@ -393,7 +393,7 @@ class StructureFrom(Structure):
         self.mat_type = inputfile.mat_type
         # Loading material list
         self.material = inputfile.material
-        totallayer = alen(self.material)
+        totallayer = len(self.material)
         logger.info("Total layer number: %s",totallayer)
         
         # Calculate the required number of grid points
@@ -408,10 +408,10 @@ class StructureFrom(Structure):
                 
         # Loading materials database #
         self.material_property = database.materialproperty
-        totalmaterial = alen(self.material_property)
+        totalmaterial = len(self.material_property)
         
         self.alloy_property = database.alloyproperty
-        totalalloy = alen(self.alloy_property)
+        totalalloy = len(self.alloy_property)
         
         logger.info("Total number of materials in database: %d" %(totalmaterial+totalalloy))
         
@@ -652,7 +652,8 @@ def calc_field_old(sigma,eps):#use
     for i in range(0,n_max,1):
         for j in range(0,n_max,1):
            # Note sigma is a number density per unit area, needs to be converted to Couloumb per unit area
-           F[i] = F[i] + q*sigma[j]*cmp(i,j)/(2*eps[i]) #CMP'deki i ve j yer değişebilir - de + olabilir
+           # (1 if i>j else -1 if i<j else 0) is the py3 replacement for cmp(i,j)
+           F[i] = F[i] + q*sigma[j]*(1 if i>j else -1 if i<j else 0)/(2*eps[i]) #CMP'deki i ve j yer değişebilir - de + olabilir
     return F
 
 def calc_potn(F,model):#use
@@ -44,12 +44,19 @@ inputfilename = "sample-qw-barrierdope-p_ingan"
 # Calculation
 # -----------
 # Aestimo
-use_cython = True #provides a speed up for aestimo
+use_numba = True #uses numba to compile the shooting method (fastest option)
+use_cython = True #provides a speed up for aestimo (used when numba is off/unavailable)
 # Shooting method parameters for Schrödinger Equation solution
 delta_E = 0.5*meV2J #Energy step (Joules) for initial search. Initial delta_E is 1 meV. 
 d_E = 1e-5*meV2J #Energy step (Joules) within Newton-Raphson method when improving the precision of the energy of a found level.
 E_start = 0.0    #Energy to start shooting method from (if E_start = 0.0 uses minimum of energy of bandstructure)
 Estate_convergence_test = 1e-9*meV2J
+use_brentq = True #refine each bracketed state with Brent's method rather than Newton-Raphson
+                  #(applies on every path, including the compiled numba driver)
+use_fp32_shooting = False #run the bracket scan of the numba shooting method in single
+                          #precision (the refinement stays in double precision). Faster
+                          #on memory-bound structures but resolves the trial energies to
+                          #only ~1e-4 meV, so leave off unless delta_E is much coarser.
 # FermiDirac
 FD_d_E = 1e-9 #Initial and minimum Energy step (meV) for derivative calculation for Newton-Raphson method to find E_F
 FD_convergence_test = 1e-6 #meV
@@ -57,7 +64,10 @@ np_d_E = 1.0 # Energy step (meV) for dispersion calculations
 # Poisson Loop
 damping = 0.5    #averaging factor between iterations to smooth convergence.
 max_iterations=80 #maximum number of iterations.
-convergence_test=1e-6 #convergence is reached when the ground state energy (meV) is stable to within this number between iterations.
+convergence_test=1e-6 #convergence is reached when every subband energy (meV) is stable to within this number between iterations.
+use_anderson_mixing = False #Anderson (Pulay) mixing of the potential between iterations.
+                            #Usually converges in far fewer iterations than plain damping.
+anderson_depth = 4 #number of previous iterations to mix over.
 
 # Aestimo_numpy_h
 anti_crossing_length=6 # the lower lenght limit to consider anti-crossing (nm)
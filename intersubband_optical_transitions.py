@@ -99,6 +99,7 @@ since all of the effective mass terms cancel out in the final expression.
 
 Note on Dielectric Constants
 eps_z - array of dielectric constants wrt. z for layers withing the effective medium (excluding ISBTs)
+        (convention: z is axis 0, any frequency axis is the last axis, arrays are C-order)
 eps_b - dielectric constant of media surrounding the effective medium/QW structure
       - or sometimes just the background dielectric constant.
 eps_w - dielectric constant for well layer or rather an weighted average of the dielectric
@@ -110,16 +111,51 @@ To use the results from aestimo with these functions, we need to normalise the w
     wfe = results.wfe*dx**-0.5
 
 """
+import sys
 import numpy as np
-from scipy.integrate import simps
 import matplotlib.pyplot as pl
 from itertools import combinations,permutations
-import types
-from scipy.linalg import eigh,eig
+from functools import lru_cache
+from scipy.linalg import eigh
 from aestimo import round2int
 
 sin,cos,log,exp = np.sin,np.cos,np.log,np.exp
 
+use_fp32_matrices = False #run the batched pair-integral and S-matrix products in
+                          #single precision (roughly twice the BLAS throughput and
+                          #half the memory traffic). The reported transition values
+                          #are then good to ~6 significant figures, which is far
+                          #tighter than the physics, but leave off when comparing
+                          #against double precision results. The eigensolve and
+                          #any complex eps_z handling stay in double precision.
+
+use_fp32_spectra = False #evaluate the absorption spectra of plotting_absorption in
+                         #single precision (complex64), halving the memory traffic of
+                         #the frequency sweeps. Plots only need ~3 significant figures
+                         #so this is safe for display, but leave off when the spectra
+                         #are post-processed numerically. The solver itself and the
+                         #transition parameters are unaffected.
+
+def _linewidths(linewidth,freqs):
+    """evaluate a linewidth - either a constant or a function of frequency -
+    for a vector of transition frequencies (THz real). A callable is invoked
+    once on the whole vector rather than per transition. Always returns a
+    writable array (downstream kernels may reject read-only views)."""
+    if callable(linewidth):
+        linewidth = linewidth(freqs)
+    out = np.empty(freqs.shape,dtype=np.result_type(linewidth,float))
+    out[...] = linewidth
+    return out
+
+def _normalised_wfe(results):
+    """wavefunctions normalised to m**-0.5, cached on the results object since
+    several entry points need them and the array can be large."""
+    wfe = getattr(results,'_wfe_normalised',None)
+    if wfe is None:
+        wfe = np.ascontiguousarray(results.wfe*results.dx**-0.5)
+        results._wfe_normalised = wfe
+    return wfe
+
 #Defining constants and material parameters
 q = 1.602176e-19 #C
 kb = 1.3806504e-23 #J/K
@@ -133,6 +169,11 @@ c = 299792458 #m/s
 J2meV=1e3/q #Joules to meV
 meV2J=1e-3*q #meV to Joules
 
+#unit conversions folded into single factors at import time
+meV2THz=1e-3*q/h/1e12 #transition energy (meV) to real frequency (THz)
+meV2um=1e6*h*c/(1e-3*q) #transition energy (meV) to wavelength (um)
+meV2wavno=1e-3*q/h/c*1e-2 #transition energy (meV) to wavenumber (cm**-1)
+
 
 # Electromagnetism
 # -------------------------
@@ -164,7 +205,20 @@ def uniaxial_layer_absorption(theta,w,eps_ratio,nk,d):
     nk - refractive index of media surrounding uniaxial layer
     d - thickness of layer (m).
     """
-    return -eps_ratio.imag*nk*w/c*sin(theta)**2/cos(theta)*d
+    #fold the scalar factors together first so the array only gets two passes
+    return eps_ratio.imag*(-nk*sin(theta)**2/cos(theta)*d/c)*w
+
+def _uniaxial_prefactor(theta,w,eps_b,nk,d):
+    """geometry/frequency dependent prefactor of the uniaxial layer absorption
+    for eps_ratio = eps_b*inv_eps_zz; precompute this once when evaluating
+    several models on the same frequency axis"""
+    return (-eps_b*nk*sin(theta)**2/cos(theta)*d/c)*w
+
+def _uniaxial_layer_absorption_inveps(theta,w,inv_eps_zz,eps_b,nk,d):
+    """uniaxial_layer_absorption of eps_ratio = eps_b*inv_eps_zz with the
+    (real scalar) eps_b folded into the scalar prefactor, so the scaled
+    eps_ratio array is never built"""
+    return inv_eps_zz.imag*_uniaxial_prefactor(theta,w,eps_b,nk,d)
 
 # Lorentzian oscillator model
 
@@ -188,9 +242,62 @@ def susceptibility_Losc(w,w0,f,w_p,y0,eps_b=1.0):
     or (by including eps_b!=1.0 here) as
     eps_b = epsb0 + Xi + Xi2 +...  
     """
+    if _losc_kernel is not None and not any(map(np.iscomplexobj,(w,w0,f,w_p,y0,eps_b))):
+        return _losc_kernel(w,w0,f,w_p,y0,eps_b)
     chi = (eps_b*w_p**2)*f / ( w0**2 - w**2 - 2j*y0*w )
     return chi
 
+def _losc_scalar(w,w0,f,w_p,y0,eps_b):
+    """scalar form of susceptibility_Losc used for the numba ufunc compilation"""
+    return (eps_b*w_p*w_p)*f / ( w0*w0 - w*w - 2j*y0*w )
+
+_losc_kernel = None #replaced by a compiled ufunc below when numba is available
+_losc_sum_kernel = None #replaced by a compiled sweep kernel below when numba is available
+
+def _losc_sum_sweep(w,w0,f,w_p,y0,eps_b,out):
+    """frequency sweep of the summed Lorentzian susceptibilities, written as
+    explicit loops for the numba compilation: the sum over oscillators is
+    accumulated in a scalar per frequency so the (noscillator,nfreq) grid is
+    never materialised"""
+    for i in range(w.shape[0]):
+        acc = 0.0j
+        for k in range(w0.shape[0]):
+            acc += (eps_b*w_p[k]*w_p[k])*f[k] / ( w0[k]*w0[k] - w[i]*w[i] - 2j*y0[k]*w[i] )
+        out[i] = acc
+    return out
+
+def _susceptibility_Losc_sum(w,w0,f,w_p,y0,eps_b=1.0,out=None):
+    """sum of susceptibility_Losc over a set of oscillators. The oscillator
+    parameters can be arrays (or scalars); the summation is evaluated as a
+    single fused sweep over the frequency axis rather than one ufunc pass per
+    oscillator. out - optional complex array to hold the result (it is
+    overwritten), letting parameter-scan loops reuse one buffer."""
+    w0,f,w_p,y0 = (np.atleast_1d(a) for a in np.broadcast_arrays(w0,f,w_p,y0))
+    w_arr = np.asarray(w)
+    allreal = not any(map(np.iscomplexobj,(w_arr,w0,f,w_p,y0,eps_b)))
+    if out is not None and out.dtype == np.complex64 and allreal:
+        #single precision was requested via the out buffer (see use_fp32_spectra):
+        #downcasting the inputs makes the whole sweep run in float32/complex64
+        w = w_arr = w_arr.astype(np.float32)
+        w0,f,w_p,y0 = (a.astype(np.float32) for a in (w0,f,w_p,y0))
+    if (_losc_sum_kernel is not None and w_arr.ndim == 1 and np.ndim(eps_b) == 0
+            and allreal and (out is None or out.dtype == np.complex128)):
+        if out is None:
+            out = np.empty(w_arr.shape,dtype=np.complex128)
+        return _losc_sum_kernel(np.ascontiguousarray(w_arr,dtype=np.float64),
+                                np.ascontiguousarray(w0,dtype=np.float64),
+                                np.ascontiguousarray(f,dtype=np.float64),
+                                np.ascontiguousarray(w_p,dtype=np.float64),
+                                np.ascontiguousarray(y0,dtype=np.float64),
+                                float(eps_b),out)
+    w0,f,w_p,y0 = (a[:,None] for a in (w0,f,w_p,y0))
+    if (_losc_kernel is not None and allreal
+            and not any(a.dtype == np.float32 for a in (w_arr,w0,f,w_p,y0))):
+        chi = _losc_kernel(w,w0,f,w_p,y0,eps_b)
+    else:
+        chi = (w_p**2*f)*eps_b / ( w0**2 - w**2 - 2j*y0*w )
+    return chi.sum(axis=0,out=out)
+
 # Effective medium
 
 def eff_eps_z(layer_list,isbt_term=0.0):
@@ -204,7 +311,11 @@ def eff_eps_z(layer_list,isbt_term=0.0):
     isbt_term - is the contribution of the intersubband transitions
     to the effective medium (see Zaluzny PRB1999, Ando1977 and Ando1982)
     """
-    eps_z = 1.0/sum([f/eps_z for eps_z,f in layer_list],isbt_term)
+    #stack the layers and contract against the fill fractions in one pass
+    #rather than accumulating an array temporary per layer
+    f_vec = np.array([f for eps_z,f in layer_list])
+    inveps_stack = np.stack(np.broadcast_arrays(*[1.0/eps_z for eps_z,f in layer_list]))
+    eps_z = 1.0/(np.einsum('i,i...->...',f_vec,inveps_stack) + isbt_term)
     return eps_z
     
 def eff_eps_z2(eps_z,isbt_term=0.0):
@@ -218,7 +329,7 @@ def eff_eps_z2(eps_z,isbt_term=0.0):
     isbt_term - is the contribution of the intersubband transitions
     to the effective medium (see Zaluzny PRB1999, Ando1977 and Ando1982)
     """
-    eps = 1.0/sum(np.mean(np.atleast_1d(1.0/eps_z),axis=0),isbt_term)
+    eps = 1.0/(model_ctx(eps_z)['inveps_mean'] + isbt_term)
     return eps
     
 def eff_eps_x(layer_list):
@@ -230,7 +341,9 @@ def eff_eps_x(layer_list):
     layer_list - list of (eps_x,f) tuples where f is the fraction
     of the total thickness filled by that dielectric constant.
     """
-    eps_x = sum([f*eps_x for eps_x,f in layer_list])
+    f_vec = np.array([f for eps_x,f in layer_list])
+    eps_stack = np.stack(np.broadcast_arrays(*[eps_x for eps_x,f in layer_list]))
+    eps_x = np.einsum('i,i...->...',f_vec,eps_stack)
     return eps_x
     
 def eff_eps_x2(eps_x):
@@ -251,10 +364,27 @@ def eff_eps_x2(eps_x):
 # Singular Electric Dipole Transitions (each transition is treated separately)
 # ------------------------------------
 
+@lru_cache()
+def _simpson_weights(n,dz):
+    """weights for composite Simpson's rule on a uniform grid of n samples
+    with spacing dz, including Cartwright's correction for the final interval
+    when n is even (mirroring scipy.integrate.simpson). Cached so that the
+    integrals of repeated calls reduce to a single dot product."""
+    w = np.zeros(n)
+    m = n if n % 2 else n-1 #the classic rule needs an odd number of samples
+    w[0:m] = 2.0*dz/3
+    w[1:m:2] = 4.0*dz/3
+    w[0] = w[m-1] = dz/3
+    if n % 2 == 0: #Cartwright's correction for the final interval
+        w[-3] -= dz/12
+        w[-2] += 8*dz/12
+        w[-1] += 5*dz/12
+    return w
+
 def dipole_matrix(z,wfe1,wfe2):
     """Calculates dipole matrix element numerically. Returns values in metres
     (electron charge is not included in calculation)"""
-    return simps(z*wfe1*wfe2,z)
+    return np.dot(_simpson_weights(len(z),z[1]-z[0]),z*wfe1*wfe2)
 
 def oscStr(z_if,w_if,cb_meff):
     """Calculates oscillator strength. 
@@ -268,13 +398,21 @@ def calc_S(Psi0,Psi1,Psi2,Psi3,dz):
     intersubband transition of a quantum well.
     Psi0 - Psi3 are arrays describing the wavefunctions.
     dz is the step-size (metres) for the arrays (assumed to be constant).
+    The three nested integrals reduce to two prefix sums and a dot product.
     """
+    i1 = np.cumsum(Psi0*Psi1)
+    i2 = np.cumsum(i1)
+    return -dz**3*np.dot(Psi2*Psi3,i2)
+
+def _calc_S_kernel(Psi0,Psi1,Psi2,Psi3,dz):
+    """single-pass form of calc_S used for the numba compilation (avoids the
+    temporary arrays of the vectorised version)"""
     i1=0.0; i2=0.0; i3=0.0
-    for p0,p1,p2,p3 in zip(Psi0,Psi1,Psi2,Psi3):
-        delta = p0*p1
+    for k in range(Psi0.shape[0]):
+        delta = Psi0[k]*Psi1[k]
         i1+=delta
         i2+=i1
-        i3+=p2*p3*i2
+        i3+=Psi2[k]*Psi3[k]*i2
     i3*=dz**3
     return -i3
 
@@ -284,14 +422,25 @@ def calc_S_b(Psi0,Psi1,Psi2,Psi3,zaxis):
     Psi0 - Psi3 are arrays describing the wavefunctions.
     zaxis is an array of z-values for the wavefunctions (needn't be uniform) (metres)
     """
-    dz_axis = zaxis[1:]-zaxis[:-1]
-    dz_axis = np.hstack((dz_axis[0],dz_axis)) #preprend a value so that all values get used in calculation
+    dz_axis = np.empty_like(zaxis)
+    dz_axis[1:] = zaxis[1:]-zaxis[:-1]
+    dz_axis[0] = dz_axis[1] #repeat the first step so that all values get used in calculation
+    delta = Psi0*Psi1
+    i1 = np.cumsum(delta)
+    i2 = np.cumsum(zaxis*delta)
+    return -np.dot(Psi2*Psi3*(zaxis*i1 - i2),dz_axis**2)
+
+def _calc_S_b_kernel(Psi0,Psi1,Psi2,Psi3,zaxis):
+    """single-pass form of calc_S_b used for the numba compilation"""
+    dz0 = zaxis[1]-zaxis[0] #use the first step for the first point too so that all values get used in calculation
     i1=0.0; i2=0.0; i3=0.0
-    for p0,p1,p2,p3,z,dz in zip(Psi0,Psi1,Psi2,Psi3,zaxis,dz_axis):
-        delta = p0*p1
+    for k in range(Psi0.shape[0]):
+        dz = zaxis[k]-zaxis[k-1] if k>0 else dz0
+        z = zaxis[k]
+        delta = Psi0[k]*Psi1[k]
         i1+=delta
         i2+=z*delta
-        i3+=p2*p3*(z*i1 - i2)*dz**2
+        i3+=Psi2[k]*Psi3[k]*(z*i1 - i2)*dz**2
     return -i3
 
 def L_eff(w_if,S_if,cb_meff):
@@ -328,6 +477,24 @@ def calc_R2(w_if,z_if,dn_if,eps_w,Lperiod):
 
 # Summary of Transitions
 
+class TransitionsTable(list):
+    """the list of per-transition dicts returned by transitions(). It behaves
+    exactly like the plain list it used to be but additionally caches each
+    column as a numpy array for the vectorised model functions, so they don't
+    rebuild the arrays from the python dicts on every call."""
+    def col(self,key):
+        cols = self.__dict__.setdefault('_cols',{})
+        if key not in cols:
+            cols[key] = np.array([trn[key] for trn in self])
+        return cols[key]
+
+def _table_col(transitions_table,key):
+    """column of a transitions table as an array; cached when the table is a
+    TransitionsTable, rebuilt when given a plain list of dicts"""
+    if isinstance(transitions_table,TransitionsTable):
+        return transitions_table.col(key)
+    return np.array([trn[key] for trn in transitions_table])
+
 def transition_generator(seq):
     """returns the possible pairs in the input sequence. Each pair is
     only returned once and the ordering found in the input is maintained"""
@@ -353,7 +520,7 @@ def transitions(results,Lperiod,eps_z,linewidths):
     T = results.T #K
     dx = results.dx #m
     xaxis = results.xaxis #m
-    wfe = results.wfe*dx**-0.5 # normalising wavefunctions to be m**-0.5
+    wfe = _normalised_wfe(results) # wavefunctions normalised to be m**-0.5
     #reversethepolarities = np.ones(wfe.shape[0])
     #reversethepolarities[1::2]*=-1
     #for j,p in enumerate(reversethepolarities):wfe[j]*=p
@@ -362,13 +529,32 @@ def transitions(results,Lperiod,eps_z,linewidths):
     #using the lowest subband of the system.
     eps_w = 1.0/(np.sum(wfe[0]**2/eps_z,axis=0)*dx)
     
-    #create linewidth function
-    if type(linewidths) is types.FunctionType:
-        lw = linewidths
-    else:
-        lw = lambda freq: linewidths
-     
-    
+    #batch the integrals for all of the transition pairs at once. Each pair's
+    #dipole and S integrals share the wavefunction product wfe[i]*wfe[f], so we
+    #build those products as the rows of one (ntr,n_max) array and evaluate
+    #every integral with vectorised cumsums/dot products instead of calling
+    #the per-pair helpers from the loop below.
+    #np.triu_indices yields the pairs in the same order as transition_generator
+    #but as fancy-index arrays rather than a python loop
+    ii,ff = np.triu_indices(len(E_state),k=1)
+    A = wfe[ii]*wfe[ff] #(ntr,n_max)
+    zaxis = xaxis
+    if use_fp32_matrices:
+        A = A.astype(np.float32)
+        zaxis = xaxis.astype(np.float32)
+    z_all = (A*zaxis).dot(_simpson_weights(len(zaxis),dx)) #dipole_matrix for every pair
+    i1 = np.cumsum(A,axis=1)
+    S_all = -dx**3*np.einsum('kn,kn->k',A,np.cumsum(i1,axis=1),optimize=True) #calc_S for every pair
+    dz_axis = np.empty_like(zaxis)
+    dz_axis[1:] = zaxis[1:]-zaxis[:-1]
+    dz_axis[0] = dz_axis[1]
+    i2b = np.cumsum(zaxis*A,axis=1)
+    S_b_all = -np.einsum('kn,n->k',A*(zaxis*i1 - i2b),dz_axis**2,optimize=True) #calc_S_b for every pair
+
+    #transition broadenings for every pair at once
+    freq_all = (np.asarray(E_state)[ff]-np.asarray(E_state)[ii])*meV2THz #THz (real)
+    y_all = _linewidths(linewidths,freq_all)
+
     def transition(j,i,f): #Doing it this way would let me create a dielectric function for each transition using a function closure.
         """j - transition number (useful later)
            i - initial level
@@ -389,18 +575,18 @@ def transitions(results,Lperiod,eps_z,linewidths):
         
         dE = E_state[f]-E_state[i] #meV
         dN = N_state[i]-N_state[f] #m**2
-        z_if = dipole_matrix(xaxis,wfe[i],wfe[f]) #m
-        S_if = calc_S(wfe[i],wfe[f],wfe[i],wfe[f],dx) #m
-        S_if_b = calc_S_b(wfe[i],wfe[f],wfe[i],wfe[f],xaxis) #m
+        z_if = z_all[j] #m (dipole matrix element, batched above)
+        S_if = S_all[j] #m
+        S_if_b = S_b_all[j] #m
         L_if = L_eff(dE,S_if,cb_meff) #m
         
         col = {'j':j,
                'ilevel':i,
                'flevel':f,
                'dE':dE, #meV
-               'freq':dE*1e-3*q/h/1e12, #THz (real)
-               'lambda':1e6*h*c/(dE*1e-3*q), #(um)
-               'wavno':dE*1e-3*q/h/c*1e-2, #(cm**-1)
+               'freq':dE*meV2THz, #THz (real)
+               'lambda':meV2um/dE, #(um)
+               'wavno':dE*meV2wavno, #(cm**-1)
                'dN':dN*10**(-4-11), #dN (m-2)
                'z_if':z_if*1e9, # z (dipole matrix element) (nm)
                'f':oscStr(z_if,dE,cb_meff), #f (oscillator strength)
@@ -412,12 +598,12 @@ def transitions(results,Lperiod,eps_z,linewidths):
                'Lperiod':Lperiod*1e9, #nm
                'eps_w':eps_wi,
                }
-        col['y_if'] = lw(col['freq']) #(THz real) transition broadening
+        col['y_if'] = y_all[j] #(THz real) transition broadening
         return col
     
-    transitions_table = []
-    for j,(i,f) in enumerate(transition_generator(np.arange(len(E_state)))):
-        col = transition(j,i,f)
+    transitions_table = TransitionsTable()
+    for j,(i,f) in enumerate(zip(ii,ff)):
+        col = transition(j,int(i),int(f))
         transitions_table.append(col)
     
     hdr=['j','ilevel','flevel','dE','freq','lambda','wavno','dN','z_if','f','Leff','S_if','S_if_b','wp','R','Lperiod','y_if','eps_w']
@@ -429,20 +615,20 @@ def transitions(results,Lperiod,eps_z,linewidths):
 def print_levels(results):
     """prints out energy levels and their populations. Also
     print out their gaps"""
-    print 'the energy levels\population are (meV)\t(m**-2):'
-    for Ei,Ni in zip(results.E_state,results.N_state): print Ei,'\t',Ni
-    print
-    print 'T = %gK' %results.T
-    print
-    print 'the energy levels gaps are'
-    print '\t'.join(('(meV)','(THz)','(um)','(wavno)'))
-    for leveli,levelj in transition_generator(results.E_state):
-        gap=levelj-leveli
-        freq=gap*1e-3*q/h/1e12
-        wav=1e6*h*c/(gap*1e-3*q)
-        wavno=gap*1e-3*q/h/c*1e-2
-        print '\t'.join('%.3g' %i for i in (gap,freq,wav,wavno))
-    #print
+    lines = ['the energy levels\population are (meV)\t(m**-2):']
+    lines+= ['%s \t %s' %(Ei,Ni) for Ei,Ni in zip(results.E_state,results.N_state)]
+    lines+= ['','T = %gK' %results.T,'']
+    lines.append('the energy levels gaps are')
+    lines.append('\t'.join(('(meV)','(THz)','(um)','(wavno)')))
+    #all gaps and unit conversions at once; triu_indices pairs the levels in
+    #the same order as transition_generator
+    E = np.asarray(results.E_state)
+    ii,ff = np.triu_indices(len(E),k=1)
+    gaps = E[ff]-E[ii]
+    cols = (gaps,gaps*meV2THz,meV2um/gaps,gaps*meV2wavno)
+    lines+= ['\t'.join(format(i,'.3g') for i in row) for row in zip(*cols)]
+    #write the whole section in one go rather than flushing stdout per line
+    sys.stdout.write('\n'.join(lines)+'\n')
     
 def print_transitions(transitions_table,hdr,units):
     """print out summary of transition values""" 
@@ -459,14 +645,16 @@ def print_transitions(transitions_table,hdr,units):
             yield slice(startindex,startindex+cols_per_repeat)
             startindex += cols_per_repeat
     
-    print "Summary of Intersubband Transitions"
+    lines = ["Summary of Intersubband Transitions"]
+    #pull each variable out as a column once rather than one dict lookup per cell
+    columns = [(var,unit,_table_col(transitions_table,var)) for var,unit in zip(hdr,units)]
     for selection in repeat_generator(len(transitions_table),cols_per_repeat):
-        data = transitions_table[selection]
-        for var,unit in zip(hdr,units):
+        for var,unit,col in columns:
             row = [var.rjust(var_w),unit.rjust(unit_w)]
-            row += [('%.3g' %tr[var]).rjust(data_w) for tr in data]
-            print ''.join(row)
-        print
+            row += [format(x,'.3g').rjust(data_w) for x in col[selection]]
+            lines.append(''.join(row))
+        lines.append('')
+    sys.stdout.write('\n'.join(lines)+'\n')
 
 def get_Leff_est(transitions_table):
     """gets a value of Leff for the QW that will be applied to all transitions.
@@ -477,53 +665,83 @@ def get_Leff_est(transitions_table):
 ## Calculating Dielectric Constants
 # Below we have some different models for intersubband transitions
 
-def inv_eps_zz_1(transitions_table,freqaxis,eps_z):
+def model_ctx(eps_z):
+    """Precomputes quantities shared by the inv_eps_zz_* model functions.
+    Callers comparing several models against the same eps_z profile can build
+    this once and pass it via the functions' ctx keyword so that the mean of
+    1/eps_z isn't reduced over the z-axis on every call. A scalar eps_z (the
+    common uniform-dielectric case) stays scalar, so the models never
+    materialise a z-axis array for it."""
+    if np.ndim(eps_z) == 0:
+        return {'inveps_mean': 1.0/eps_z}
+    eps_arr = np.asarray(eps_z,dtype=np.result_type(eps_z,float))
+    return {'inveps_mean': np.reciprocal(eps_arr).mean(axis=0)}
+
+def inv_eps_zz_1(transitions_table,freqaxis,eps_z,ctx=None,out=None):
     """calculates eps_b/eps_zz using the analytical result for a single transition.
     If there are several active transitions that are close together then this will
-    become increasingly incorrect. The dielectric constant is calculated for the 
+    become increasingly incorrect. The dielectric constant is calculated for the
     effective medium of QW + barrier. However, there is an assumption here that
-    eps_background = eps_barrier = eps_well_layer"""
-    isbt_term = 0.0
-    for trn in transitions_table: #nb. first row of table describes the units of each variable
-        w_if = np.sqrt(trn['freq']**2 + trn['wp']**2) #depolarisation shifted frequency
-        Xi = susceptibility_Losc(freqaxis,w0=w_if,f=1.0,w_p=trn['R'],y0=trn['y_if'])
-        #print trn['R'],np.sqrt(trn['f']*trn['wp']**2*trn['Leff']/trn['Lperiod'])
-        isbt_term -= Xi
-    inv_eps_zz = np.mean(np.atleast_1d(1.0/eps_z),axis=0) + isbt_term
+    eps_background = eps_barrier = eps_well_layer
+    out - optional complex array of freqaxis' shape; the result is written into
+    it and returned, letting parameter-scan loops reuse one buffer per thread."""
+    #nb. first row of table describes the units of each variable
+    freq = _table_col(transitions_table,'freq')
+    wp = _table_col(transitions_table,'wp')
+    R = _table_col(transitions_table,'R')
+    y0 = _table_col(transitions_table,'y_if')
+    w_if = freq*freq #depolarisation shifted frequencies, built in place
+    w_if += wp*wp
+    np.sqrt(w_if,out=w_if)
+    #print R,np.sqrt(f*wp**2*Leff/Lperiod)
+    inv_eps_zz = _susceptibility_Losc_sum(freqaxis,w0=w_if,f=1.0,w_p=R,y0=y0,out=out)
+    np.negative(inv_eps_zz,out=inv_eps_zz)
+    if ctx is None: ctx = model_ctx(eps_z)
+    inv_eps_zz += ctx['inveps_mean']
     return inv_eps_zz
 
-def eps_classical(transitions_table,freqaxis,eps_b=1.0):
+def eps_classical(transitions_table,freqaxis,eps_b=1.0,out=None):
     """calculates total dielectric constant epszz for QW by summing susceptibilities
     of each transition. If you leave eps_b=1.0 then the result should be multiplied
     by eps_b, if you use eps_b then you shouldn't need to do anything. In either 
     case it should match the values used for calculating the transition plasma frequencies.
     
-    WARNING: This shouldn't be used on its own for modelling ISBTs."""
-    eps = eps_b
-    for trn in transitions_table: #nb. first row of table describes the units of each variable
-        Xi = susceptibility_Losc(freqaxis,w0=trn['freq'],f=trn['f'],w_p=trn['wp'],y0=trn['y_if'],eps_b=eps_b)
-        eps+=Xi
+    WARNING: This shouldn't be used on its own for modelling ISBTs.
+    out - optional complex array of freqaxis' shape to hold the result
+    (see inv_eps_zz_1)."""
+    #nb. first row of table describes the units of each variable
+    freq = _table_col(transitions_table,'freq')
+    f = _table_col(transitions_table,'f')
+    wp = _table_col(transitions_table,'wp')
+    y0 = _table_col(transitions_table,'y_if')
+    eps = _susceptibility_Losc_sum(freqaxis,w0=freq,f=f,w_p=wp,y0=y0,eps_b=eps_b,out=out)
+    eps += eps_b
     return eps
 
-def inv_eps_zz_classical(transitions_table,freqaxis,eps_z):
-    """Calculates the dielectric constant for an effective medium containing 
+def inv_eps_zz_classical(transitions_table,freqaxis,eps_z,ctx=None,out=None):
+    """Calculates the dielectric constant for an effective medium containing
     intersubband transitions using a classical approach (Lorentz oscillators &
     formula for effective medium).
     Slab model?
+    out - optional complex array of freqaxis' shape to hold the result
+    (see inv_eps_zz_1).
     """
     eps_w = transitions_table[0]['eps_w']
-    if True:        
-        eps_qw = eps_w*eps_classical(transitions_table,freqaxis) 
-    else: 
-        eps_qw = eps_classical(transitions_table,freqaxis,eps_b=eps_w) #?? what's the point??
+    if True:
+        eps_qw = eps_classical(transitions_table,freqaxis,out=out)
+        eps_qw *= eps_w
+    else:
+        eps_qw = eps_classical(transitions_table,freqaxis,eps_b=eps_w,out=out) #?? what's the point??
     
     Lperiod = transitions_table[0]['Lperiod'] #nm
     Lqw = get_Leff_est(transitions_table) #(nm) 
     #using the effective length for the first transition as an estimate of the thickness of the 2d electron gas contained within the QW
     ff = Lqw/Lperiod
     #inv_eps_zz = ((1.0-ff)/eps_bb + ff/eps_qw) 
-    inveps_bb_term = np.mean(np.atleast_1d(1.0/eps_z),axis=0) - ff/eps_w
-    inv_eps_zz = inveps_bb_term + ff/eps_qw
+    if ctx is None: ctx = model_ctx(eps_z)
+    inveps_bb_term = ctx['inveps_mean'] - ff/eps_w
+    inv_eps_zz = np.divide(ff,eps_qw,out=eps_qw)
+    inv_eps_zz += inveps_bb_term
     #eff_eps_z(layer_list,isbt_term=0.0)
     return inv_eps_zz
 
@@ -532,33 +750,104 @@ def inv_eps_zz_classical(transitions_table,freqaxis,eps_z):
 def dipole_matrix_b(z,wfe1,wfe2,eps_z):
     """Calculates something similar to the dipole matrix element numerically. 
     Returns values in metres(electron charge is not included in calculation)"""
-    return simps(z*wfe1*wfe2/eps_z,z)
+    return np.dot(_simpson_weights(len(z),z[1]-z[0]),z*wfe1*wfe2/eps_z)
 
 def calc_S_c(Psi0,Psi1,Psi2,Psi3,eps_z,zaxis):
     """Calculates S, a quantity used to calculate the effective thickness of an
     intersubband transition of a quantum well.
     Psi0 - Psi3 are arrays describing the wavefunctions.
+    eps_z may be a scalar or an array of values wrt z.
     zaxis is an array of z-values for the wavefunctions (needn't be uniform) (metres)
     """
-    eps_z *= np.ones_like(zaxis)
-    dz_axis = zaxis[1:]-zaxis[:-1]
-    dz_axis = np.hstack((dz_axis[0],dz_axis)) #preprend a value so that all values get used in calculation
-    i1=0.0; i2=0.0; i3=0.0
-    for p0,p1,p2,p3,eps,dz in zip(Psi0,Psi1,Psi2,Psi3,eps_z,dz_axis):
-        delta = p0*p1
+    eps_z = np.broadcast_to(eps_z,zaxis.shape) #broadcast scalar dielectric constants to a (read-only) array view
+    return _calc_S_c(Psi0,Psi1,Psi2,Psi3,eps_z,zaxis)
+
+def _calc_S_c(Psi0,Psi1,Psi2,Psi3,eps_z,zaxis):
+    """inner integrals of calc_S_c (vectorised); eps_z must already be an
+    array (possibly complex)"""
+    i1 = np.cumsum(Psi0*Psi1)
+    i2 = np.cumsum(i1/eps_z)
+    dz = zaxis[-1]-zaxis[-2] #nb. as originally written, the last step size is used
+    return -dz**3*np.dot(Psi2*Psi3,i2)
+
+def _calc_S_c_kernel(Psi0,Psi1,Psi2,Psi3,eps_z,zaxis):
+    """single-pass form of _calc_S_c used for the numba compilation"""
+    i1=0.0
+    i2=0.0*eps_z[0] #accumulators take the (possibly complex) type of eps_z
+    i3=0.0*eps_z[0]
+    for k in range(Psi0.shape[0]):
+        delta = Psi0[k]*Psi1[k]
         i1+=delta
-        i2+=i1/eps
-        i3+=p2*p3*i2
+        i2+=i1/eps_z[k]
+        i3+=Psi2[k]*Psi3[k]*i2
+    dz = zaxis[-1]-zaxis[-2] #nb. as originally written, the last step size is used
     i3*=dz**3
     return -i3
-    
-def calc_wR_Ando(results,transitions_table,eps_z):
+
+def _ando_C_sweep(A,eps_z,out):
+    """nested cumulative integrals feeding the Ando S matrix, one row per
+    transition pair; written as explicit loops for the numba compilation so
+    the intermediate cumsum array is never materialised"""
+    for a in range(A.shape[0]):
+        i1 = 0.0
+        i2 = 0.0*eps_z[0] #accumulator takes the (possibly complex) type of eps_z
+        for n in range(A.shape[1]):
+            i1 += A[a,n]
+            i2 += i1/eps_z[n]
+            out[a,n] = i2
+    return out
+
+_ando_C_kernel = None #replaced by a compiled version below when numba is available
+
+try:
+    #compile the S-integral loops - they are the hottest part of the transition
+    #calculations, being called for every pair (calc_S/calc_S_b) and every pair
+    #of pairs (calc_S_c) of subbands. Without numba the vectorised numpy
+    #versions above are used instead.
+    import numba
+    calc_S = numba.njit(cache=True, fastmath=True)(_calc_S_kernel)
+    calc_S_b = numba.njit(cache=True, fastmath=True)(_calc_S_b_kernel)
+    _calc_S_c = numba.njit(cache=True, fastmath=True)(_calc_S_c_kernel)
+    #a fused ufunc for the Lorentzian susceptibility - avoids the F-length
+    #temporaries of the numpy expression (the complex-valued eps_z case falls
+    #back to the numpy expression)
+    _losc_kernel = numba.vectorize(['complex128(float64,float64,float64,float64,float64,float64)'],
+                                   cache=True)(_losc_scalar)
+    #and the fused frequency sweep used by the inv_eps_zz_* models (no fastmath
+    #here - it keeps the oscillator accumulation order deterministic). The
+    #input arrays are declared read-only because the callers pass broadcast
+    #views (see _ando_C_kernel below for the same pattern); out stays writable
+    def _losc_sum_sig():
+        from numba import types
+        ro1 = types.Array(types.float64,1,'C',readonly=True)
+        return types.Array(types.complex128,1,'C')(ro1,ro1,ro1,ro1,ro1,types.float64,
+                                                   types.Array(types.complex128,1,'C'))
+    _losc_sum_kernel = numba.njit(_losc_sum_sig(),cache=True)(_losc_sum_sweep)
+    #explicit signatures so the three dtype combinations calc_wR_Ando feeds in
+    #(double, complex eps_z, use_fp32_matrices) are compiled eagerly and served
+    #from the on-disk cache instead of being specialised on the first call.
+    #eps_z arrives as a (read-only) broadcast view, which the string signature
+    #syntax cannot express, hence the types API
+    def _ando_C_sigs():
+        from numba import types
+        C2 = lambda dt: types.Array(dt,2,'C')
+        ro1 = lambda dt: types.Array(dt,1,'C',readonly=True)
+        return [C2(types.float64)(C2(types.float64),ro1(types.float64),C2(types.float64)),
+                C2(types.complex128)(C2(types.float64),ro1(types.complex128),C2(types.complex128)),
+                C2(types.float32)(C2(types.float32),ro1(types.float32),C2(types.float32))]
+    _ando_C_kernel = numba.njit(_ando_C_sigs(), cache=True, fastmath=True)(_ando_C_sweep)
+except ImportError:
+    pass
+
+def calc_wR_Ando(results,transitions_table,eps_z,num_eigs=None):
     """Uses a multilevel version of the mathematical formalism given in Ando 1977
     A matrix is constucted describing the transitions and the interactions between
     them which can be diagonalised to give a description of the system as a simple
     sequence of Lorentzian oscillators.
     eps_z is an array of the dielectric constant wrt z for the media in the barrier+QW+barrier
     structure.
+    num_eigs - optionally only solve for this many of the lowest-frequency
+    eigenmodes (useful for structures with many subbands).
     """
     ttunits = transitions_table[0]
     #number of transitions
@@ -567,60 +856,84 @@ def calc_wR_Ando(results,transitions_table,eps_z):
     #So [0,0] is the transition for levels 0->1
     #construct transition matrix S & B
     dx = results.dx #m
-    wfe = results.wfe*dx**-0.5
+    wfe = _normalised_wfe(results)
     zaxis = results.xaxis #m
-    # S matrix
-    S = np.zeros((ntr,ntr))
-    for tra in transitions_table:
-        a = tra['j']
-        S[a,a] = calc_S_c(wfe[tra['ilevel']],wfe[tra['flevel']],wfe[tra['ilevel']],wfe[tra['flevel']],eps_z,zaxis)
-    for tra,trb in combinations(transitions_table,2):
-        a = tra['j']
-        b = trb['j']
-        S[a,b] = S[b,a] = calc_S_c(wfe[tra['ilevel']],wfe[tra['flevel']],wfe[trb['ilevel']],wfe[trb['flevel']],eps_z,zaxis)
+    # S matrix - one batched contraction instead of a calc_S_c call per pair.
+    # Row a of A is the product of pair a's wavefunctions and row a of C holds
+    # the two nested integrals of calc_S_c, so S for pairs (a,b) is the single
+    # matrix product -dz**3*A.C^T (a GEMM) rather than ntr**2 python calls.
+    #rows of the table are in j order, so the cached columns index straight in
+    ilevels = _table_col(transitions_table,'ilevel').astype(np.intp)
+    flevels = _table_col(transitions_table,'flevel').astype(np.intp)
+    dN = _table_col(transitions_table,'dN').astype(np.float64)
+    dE = _table_col(transitions_table,'dE').astype(np.float64)
+    A = wfe[ilevels]*wfe[flevels]
+    eps_za = np.broadcast_to(eps_z,zaxis.shape) #broadcast scalar dielectric constants to a (read-only) array view
+    if use_fp32_matrices and not np.iscomplexobj(eps_z):
+        A = A.astype(np.float32)
+        eps_za = eps_za.astype(np.float32)
+    if _ando_C_kernel is not None:
+        #normalise eps_z onto one of the kernel's compiled signatures
+        eps_dtype = (np.complex128 if np.iscomplexobj(eps_za) else
+                     (np.float32 if eps_za.dtype == np.float32 else np.float64))
+        eps_zc = np.ascontiguousarray(eps_za,dtype=eps_dtype)
+        C = _ando_C_kernel(A,eps_zc,np.empty(A.shape,dtype=np.result_type(A,eps_zc)))
+    else:
+        C = np.cumsum(np.cumsum(A,axis=1)/eps_za,axis=1)
+    dz = zaxis[-1]-zaxis[-2] #nb. see calc_S_c
+    M = -dz**3*A.dot(C.T)
+    #as before, the entry for pair (a,b) with a<=b is evaluated with pair a in
+    #the inner integrals and mirrored onto (b,a)
+    S = np.tril(M) + np.tril(M,-1).T
     #print 'S';print S
     # B matrix
     #B = 2*S_ab*e**2/(eps0) * sqrt((n_a - n_-a)*(n_b - n_b)*hbar*w_a*hbar*w_b) + delta_ab*hbar**2*w_a**2
     const = 2*q**2/eps0*meV2J*1e15 # 1e15 converts dN values into carriers/m**2
-    B = np.zeros((ntr,ntr))
-    for tra in transitions_table:
-        a = tra['j']
-        B[a,a] = const*S[a,a]*np.sqrt(tra['dN']*tra['dE']*tra['dN']*tra['dE']) + (tra['dE']*meV2J)**2
-    for tra,trb in combinations(transitions_table,2):
-        a = tra['j']
-        b = trb['j']
-        B[a,b] = B[b,a] = const*S[a,b]*np.sqrt(tra['dN']*tra['dE']*trb['dN']*trb['dE'])
+    P = dN*dE
+    B = const*S*np.sqrt(np.outer(P,P))
+    B[np.diag_indices(ntr)] += (dE*meV2J)**2
     #print 'B'; print B
-    #diagonalise
-    if np.iscomplex(eps_z).any():
-        Bdiag,U = eigh(B, lower=True, eigvals_only=False, turbo=True, type=1)
+    #diagonalise. B is symmetric by construction so we can always use the
+    #symmetric/Hermitian solver, which is several times faster than the
+    #general eig() and returns real, sorted eigenvalues. The RRR driver
+    #('evr') is the fastest choice for the small-to-mid matrix sizes seen
+    #here and is also what LAPACK uses for eigenvalue subsets, so both
+    #branches share it; B is scratch after this so LAPACK may overwrite it,
+    #and it is finite by construction so the check is skipped.
+    if num_eigs is not None:
+        Bdiag,U = eigh(B, subset_by_index=[0,num_eigs-1],
+                       overwrite_a=True, check_finite=False)
     else:
-        Bdiag,U = eig(B)
+        Bdiag,U = eigh(B, driver='evr', overwrite_a=True, check_finite=False)
     #final values of R,w0
-    rhs = np.zeros(ntr)
-    for tra in transitions_table:
-        a = tra['j'] #find correct index
-        i = tra['ilevel']
-        f = tra['flevel']
-        x_if = dipole_matrix_b(zaxis,wfe[i],wfe[f],eps_z)
-        rhs[a] = np.sqrt(tra['dN']*1e15*tra['dE']*meV2J)*q*x_if
-    Ry2a = np.dot(U.transpose(),rhs)**2 * 2.0/(eps0*tra['Lperiod']*1e-9)*(1e-12/h)**2#THz**2 (real)
+    #dipole_matrix_b for every pair at once - rows of A are already the pair
+    #wavefunction products
+    x_all = (A*zaxis/eps_za).dot(_simpson_weights(len(zaxis),zaxis[1]-zaxis[0]))
+    rhs = np.sqrt(dN*1e15*dE*meV2J)*q*x_all
+    Ry2a = np.dot(U.transpose(),rhs)**2 * 2.0/(eps0*ttunits['Lperiod']*1e-9)*(1e-12/h)**2#THz**2 (real)
     wya = np.sqrt(Bdiag)/h*1e-12 #THz (real)
     return wya,Ry2a
 
 def print_wR(wya,Rya2):
-    print 'w     R'
-    for wy,Ry2 in zip(wya,Ry2a):
-        print wy,np.sqrt(Ry2)   
+    lines = ['w     R']
+    lines+= ['%s %s' %(wy,np.sqrt(Ry2)) for wy,Ry2 in zip(wya,Rya2)]
+    sys.stdout.write('\n'.join(lines)+'\n')
 
-def inv_eps_zz_Ando(wya,Ry2a,transitions_table,linewidth,freqaxis,eps_z):
-    """calculate dielectric constant ratio - eps_b/eps_ISBT for results of matrix calculation"""
-    inveps = np.mean(1.0/eps_z)
+def inv_eps_zz_Ando(wya,Ry2a,transitions_table,linewidth,freqaxis,eps_z,ctx=None,out=None):
+    """calculate dielectric constant ratio - eps_b/eps_ISBT for results of matrix calculation.
+    out - optional complex array of freqaxis' shape to hold the result (see inv_eps_zz_1)."""
     ff0 = transitions_table[0]['Leff']/transitions_table[0]['Lperiod']
-    for wy,Ry2 in zip(wya,Ry2a):
-        y_y = linewidth(np.sqrt(wy**2-Ry2/ff0)) if callable(linewidth) else linewidth #(THz real?) guesstimate of transition broadening (written to get result as close as possible to other models)
-        Xi = susceptibility_Losc(freqaxis,w0=wy,f=Ry2,w_p=1.0,y0=y_y)
-        inveps-= Xi
+    wya = np.asarray(wya); Ry2a = np.asarray(Ry2a)
+    #(THz real?) guesstimate of transition broadenings (written to get result as close as possible to other models)
+    w_ya = Ry2a/ff0 #reuse the one temporary rather than chaining fresh ones
+    np.negative(w_ya,out=w_ya)
+    w_ya += wya*wya
+    np.sqrt(w_ya,out=w_ya)
+    y_ya = _linewidths(linewidth,w_ya)
+    if ctx is None: ctx = model_ctx(eps_z)
+    inveps = _susceptibility_Losc_sum(freqaxis,w0=wya,f=Ry2a,w_p=1.0,y0=y_ya,out=out)
+    np.negative(inveps,out=inveps)
+    inveps += ctx['inveps_mean']
     return inveps
     
 ## Making plots of absorption
@@ -639,58 +952,72 @@ def plotting_absorption(model,results,transitions_table,eps_b,eps_z,linewidth):
         ax1.axvline(trn['freq'])
     
     theta =pi/4
-    nk = np.sqrt(np.mean(np.atleast_1d(eps_z),axis=0)) # should be eps_xx really
+    # should be eps_xx really; scalar eps_z skips the z-axis reduction
+    nk = np.sqrt(eps_z) if np.ndim(eps_z) == 0 else np.sqrt(np.mean(eps_z,axis=0))
     d = transitions_table[0]['Lperiod']*1e-9
     f2w = 1e12*2*pi
+    omega = freqaxis*f2w #(rad/s) computed once for all of the models below
+    ctx = model_ctx(eps_z) #shared by the inv_eps_zz_* models below
     
     #model 0 # the slightly niave model usng the 'standard' absorption calculation and Lorentz oscillator model
     # this is only for comparison.
     eps_simple = eps_classical(transitions_table,freqaxis,eps_b)#.conjugate()
     Leff0 = get_Leff_est(transitions_table)*1e-9
-    absorption_simple = absorption_standard(freqaxis*f2w,eps_simple,Leff0)
+    absorption_simple = absorption_standard(omega,eps_simple,Leff0)
     #eps_b=1.0
     #ff = transitions_table[0]['Leff']/Lperiod
-    #absorption_simple = uniaxial_layer_absorption(theta,freqaxis*f2w,eps_b/eps_simple,nk,ff*d)
-    ax1.plot(freqaxis,absorption_simple,label='Naive Model')
-    
+    #absorption_simple = uniaxial_layer_absorption(theta,omega,eps_b/eps_simple,nk,ff*d)
+
     #model 1 # Uses the analytically correct result for a single transition but can be incorrect for multiple transitions
-    eps_ratio1 = eps_b*inv_eps_zz_1(transitions_table,freqaxis,eps_z)
-    absorption1 = uniaxial_layer_absorption(theta,freqaxis*f2w,eps_ratio1,nk,d)
-    ax1.plot(freqaxis,absorption1,label='Independent Transitions Model')
-    
+    #the inv_eps_zz buffer is shared between models 1 and 3 and eps_b is folded
+    #into the absorption prefactor rather than scaling the whole spectrum
+    spec_dtype = np.complex64 if use_fp32_spectra else np.complex128
+    scratch = np.empty(freqaxis.shape,dtype=spec_dtype)
+    uniax_pref = _uniaxial_prefactor(theta,omega,eps_b,nk,d) #shared by models 1 and 3
+    inv_eps_zz1 = inv_eps_zz_1(transitions_table,freqaxis,eps_z,ctx=ctx,out=scratch)
+    absorption1 = inv_eps_zz1.imag*uniax_pref
+
     #model 2 # A classical approach to modelling multiple transitions. Not exact but accounts for coupling between transitions in a physically intuitive way.
     #eps_ratio2 = eps_b*inv_eps_zz_classical(transitions_table,freqaxis,eps_z)
-    #absorption2 = uniaxial_layer_absorption(theta,freqaxis*f2w,eps_ratio2,nk,d)
+    #absorption2 = uniaxial_layer_absorption(theta,omega,eps_ratio2,nk,d)
     #ax1.plot(freqaxis,absorption2,label='Classical Transitions Model')
     
     #model 3 # An accurate model for multiple transitions (neglecting non-parabolicity).  
     wya,Ry2a = calc_wR_Ando(results,transitions_table,eps_z)
-    inv_eps_zz3 = inv_eps_zz_Ando(wya,Ry2a,transitions_table,linewidth,freqaxis,eps_z)
-    eps_ratio3 = eps_b*inv_eps_zz3
-    absorption3 = uniaxial_layer_absorption(theta,freqaxis*f2w,eps_ratio3,nk,d)
-    ax1.plot(freqaxis,absorption3,label='Matrix Model')
-    
+    inv_eps_zz3 = inv_eps_zz_Ando(wya,Ry2a,transitions_table,linewidth,freqaxis,eps_z,ctx=ctx,out=scratch)
+    absorption3 = inv_eps_zz3.imag*uniax_pref
+
+    #one plot call for all of the models - matplotlib creates the artists in a
+    #single pass over the stacked columns
+    lines = ax1.plot(freqaxis,np.column_stack((absorption_simple,absorption1,absorption3)))
+    for line,label in zip(lines,('Naive Model','Independent Transitions Model','Matrix Model')):
+        line.set_label(label)
+
     ax1.legend()
     if not pl.isinteractive(): pl.show()
 
 
+def _layer_edges(thicknesses,dx):
+    """grid indices of the layer boundaries: cumulative thickness (nm) rounded
+    to the nearest grid point with the same half-up rule as aestimo's round2int"""
+    positions = np.concatenate(([0.0],np.cumsum(thicknesses))) # nanometres (to minimise errors)
+    return np.floor(positions*1e-9/dx+0.5).astype(np.int64) #round2int, vectorized
+
 def eps_background_GaAs(model,eps_gaas,eps_algaas):
     """Helper function for calculating background dielectric constant
-    array for GaAs/AlGaAs structures"""
-    eps_z = np.zeros(model.n_max)
-    
-    position = 0.0 # keeping in nanometres (to minimise errors)
-    for layer in model.material:
-        startindex = round2int(position*1e-9/model.dx)
-        position += layer[0] # update position to end of the layer
-        finishindex = round2int(position*1e-9/model.dx)
-        #
-        matType = layer[1]
-        if matType == 'GaAs':
-            eps_z[startindex:finishindex] = eps_gaas
-        elif matType == 'AlGaAs':
-            eps_z[startindex:finishindex] = eps_algaas
-    return eps_z    
+    array for GaAs/AlGaAs structures. The returned array is C-contiguous
+    float64; by convention z is axis 0 and any frequency axis comes last, so
+    inner loops stay stride-1 over memory."""
+    eps_z = np.zeros(model.n_max,dtype=np.float64)
+    #convert the layer list once into plain arrays so the fill loop runs
+    #without touching python objects
+    thicknesses = np.array([layer[0] for layer in model.material],dtype=np.float64)
+    eps_map = {'GaAs':eps_gaas,'AlGaAs':eps_algaas} #material name -> dielectric constant
+    eps_vals = np.array([eps_map.get(layer[1],0.0) for layer in model.material],dtype=np.float64)
+    edges = _layer_edges(thicknesses,model.dx)
+    for i in range(len(eps_vals)): #O(n_layers) slice assignments, not O(n_max)
+        eps_z[edges[i]:edges[i+1]] = eps_vals[i]
+    return eps_z
 
 
 
@@ -720,12 +1047,19 @@ if __name__ == "__main__":
         
         # Write the simulation results in files
         aestimo.save_and_plot(result,model)
+        aestimo.save_results_npz(result) #binary copy for fast reloading
         logger.info("Simulation is finished.")
     else: #load previously calculated results from output directory
-        result = aestimo.load_results()
+        #the binary file is much quicker to load than the text output (and
+        #lossless) but older output directories will only have the text files
+        try:
+            result = aestimo.load_results_npz()
+        except IOError:
+            result = aestimo.load_results()
     
-    #Set thickness of effective medium
-    Lperiod = sum([layer[0] for layer in model.material])*1e-9 #m
+    #Set thickness of effective medium; the structure class already totals the
+    #layer thicknesses once on construction
+    Lperiod = model.x_max #m
     
     # set dielectric constants
     case = 1